@@ -1,13 +1,14 @@
 import os
+import asyncio
 import uuid
 import hashlib
 import datetime
+from functools import lru_cache
 from fastapi import FastAPI, HTTPException, Depends, Header, Request, BackgroundTasks, UploadFile, Response
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import StreamingResponse
+from fastapi.responses import StreamingResponse, ORJSONResponse
 from pydantic import BaseModel
 from typing import Optional, Dict, List
-from pathlib import Path
 from langchain_text_splitters import RecursiveCharacterTextSplitter # New import
 
 # Provider 관련 모듈 import
@@ -36,7 +37,8 @@ class DeleteItemRequest(BaseModel): # New Pydantic model for delete
     path: str
 
 # --- FastAPI 앱 설정 ---
-app = FastAPI()
+# 모든 JSON 응답을 orjson으로 직렬화합니다.
+app = FastAPI(default_response_class=ORJSONResponse)
 
 @app.on_event("startup")
 async def startup_event():
@@ -56,8 +58,8 @@ async def shutdown_event():
     for provider in app.state.sessions.values():
         if hasattr(provider, 'close'):
             await provider.close()
-    if app.state.search_service and app.state.search_service.client:
-        app.state.search_service.client.persist()
+    if app.state.search_service:
+        app.state.search_service.close()
     if app.state.index_manager:
         app.state.index_manager.close()
 
@@ -72,12 +74,15 @@ app.add_middleware(
 )
 
 # --- 의존성 주입 및 헬퍼 ---
+BEARER_PREFIX = "Bearer "
+BEARER_PREFIX_LEN = len(BEARER_PREFIX)
+
 async def get_provider_and_id(
     req: Request,
     authorization: Optional[str] = Header(None)
 ) -> tuple[FileSystemProvider, Optional[str]]:
-    if authorization and authorization.startswith("Bearer "):
-        token = authorization.split(" ")[1]
+    if authorization is not None and authorization[:BEARER_PREFIX_LEN] == BEARER_PREFIX:
+        token = authorization[BEARER_PREFIX_LEN:].strip()
         provider = req.app.state.sessions.get(token)
         if provider:
             return provider, provider.provider_id
@@ -85,21 +90,29 @@ async def get_provider_and_id(
     return req.app.state.default_provider, req.app.state.default_provider.provider_id
 
 # --- 텍스트 분할 (Chunking) 헬퍼 ---
-def chunk_text(text: str, chunk_size: int = 750, chunk_overlap: int = 75):
-    """텍스트를 중첩되는 청크로 분할합니다."""
-    if not text:
-        return []
-    
-    text_splitter = RecursiveCharacterTextSplitter(
+@lru_cache(maxsize=None)
+def get_text_splitter(chunk_size: int, chunk_overlap: int) -> RecursiveCharacterTextSplitter:
+    """청크 설정별 텍스트 분할기를 한 번만 생성하여 재사용합니다."""
+    return RecursiveCharacterTextSplitter(
         chunk_size=chunk_size,
         chunk_overlap=chunk_overlap,
         length_function=len,
         separators=["\n\n", "\n", " ", ""] # Prioritize splitting by paragraphs, then lines, then words, then characters
     )
-    chunks = text_splitter.split_text(text)
-    return chunks
+
+def chunk_text(text: str, chunk_size: int = 750, chunk_overlap: int = 75):
+    """텍스트를 중첩되는 청크로 분할합니다."""
+    if not text:
+        return []
+    
+    return get_text_splitter(chunk_size, chunk_overlap).split_text(text)
 
 # --- 백그라운드 인덱싱 작업 ---
+# 인덱싱 시 동시에 읽고 처리할 최대 파일 수
+INDEX_CONCURRENCY = 16
+# 인덱싱 대상 텍스트 파일 확장자
+TEXT_EXTENSIONS = frozenset({'.txt', '.md', '.py', '.js', '.ts', '.json', '.csv'})
+
 async def do_index_folder(provider: FileSystemProvider, provider_id: str, folder_path: str, search_service: SearchService, index_manager: IndexManager):
     """지정된 폴더를 재귀적으로 탐색하며 파일을 인덱싱하는 백그라운드 작업"""
     if not provider_id:
@@ -107,48 +120,45 @@ async def do_index_folder(provider: FileSystemProvider, provider_id: str, folder
         return
         
     index_manager.set_folder_status(provider_id, folder_path, "indexing")
-    total_chunks_indexed = 0
     
     try:
         # Provider를 통해 재귀적으로 파일 목록 가져오기
         all_items = await provider.list_files_recursive(folder_path)
         
         # 텍스트 기반 파일 필터링
-        text_extensions = ['.txt', '.md', '.py', '.js', '.ts', '.json', '.csv']
         files_to_index = [
             item for item in all_items 
-            if not item.is_directory and Path(item.name).suffix in text_extensions
+            if not item.is_directory and os.path.splitext(item.name)[1] in TEXT_EXTENSIONS
         ]
 
-        # 각 파일을 순회하며 청킹 및 인덱싱
-        for file_item in files_to_index:
+        async def read_and_chunk(file_item: FileItem) -> Optional[tuple[str, List[str]]]:
             try:
-                print(f"Attempting to read content for: {file_item.path}") # Added print
                 content = await provider.read_file_content(file_item.path)
                 if not content:
-                    print(f"Warning: read_file_content returned None for {file_item.path}. Skipping indexing.") # Added print
-                    continue
+                    print(f"Warning: read_file_content returned None for {file_item.path}. Skipping indexing.")
+                    return None
 
-                # 텍스트를 청크로 분할
-                chunks = chunk_text(content)
+                # 텍스트를 청크로 분할 (CPU 작업이므로 이벤트 루프 밖에서 실행)
+                chunks = await asyncio.to_thread(chunk_text, content)
                 if not chunks:
-                    continue
-
-                # ChromaDB에 저장할 데이터 준비
-                documents = []
-                metadatas = []
-                ids = []
-                for i, chunk in enumerate(chunks):
-                    documents.append(chunk)
-                    metadatas.append({"file_path": file_item.path, "chunk_number": i + 1})
-                    ids.append(f"{file_item.path}-chunk-{i+1}")
-                
-                # SearchService를 통해 청크들을 일괄 인덱싱
-                await search_service.index_chunks(documents=documents, metadatas=metadatas, ids=ids)
-                total_chunks_indexed += len(chunks)
+                    return None
+                return file_item.path, chunks
 
             except Exception as e:
-                print(f"Error reading or indexing file {file_item.path}: {e}")
+                print(f"Error reading file {file_item.path}: {e}")
+                return None
+
+        async def iter_file_chunks():
+            # INDEX_CONCURRENCY개씩 동시에 읽고 청킹하여 결과를 바로 넘겨줌
+            # (폴더 전체 내용을 메모리에 모으지 않도록 다음 묶음은 소비된 뒤에 읽음)
+            for start in range(0, len(files_to_index), INDEX_CONCURRENCY):
+                window = files_to_index[start:start + INDEX_CONCURRENCY]
+                for result in await asyncio.gather(*(read_and_chunk(item) for item in window)):
+                    if result is not None:
+                        yield result
+
+        # SearchService를 통해 읽은 파일의 청크를 배치 단위로 바로 인덱싱
+        total_chunks_indexed = await search_service.index_files_bulk(folder_path, iter_file_chunks())
 
         index_manager.set_folder_status(provider_id, folder_path, "indexed", file_count=total_chunks_indexed)
         print(f"Successfully indexed {total_chunks_indexed} chunks from {len(files_to_index)} files in '{folder_path}'.")
@@ -1,6 +1,6 @@
 from abc import ABC, abstractmethod
 from pydantic import BaseModel
-from typing import List, Optional, AsyncGenerator
+from typing import List, Optional, AsyncGenerator, Dict, Any
 from fastapi import UploadFile
 
 # 프론트엔드의 FileItem 인터페이스와 일치하는 Pydantic 모델
@@ -22,12 +22,13 @@ class FileSystemProvider(ABC):
         self.provider_id = provider_id
 
     @abstractmethod
-    async def list_files(self, path: str) -> List[FileItem]:
+    async def list_files(self, path: str) -> List[Dict[str, Any]]:
         """
         지정된 경로의 파일 및 디렉터리 목록을 비동기적으로 반환합니다.
+        API 응답으로 바로 직렬화되므로 모델 대신 FileItem 스키마와 같은 키를 가진 dict를 반환합니다.
 
         :param path: 조회할 경로
-        :return: FileItem 모델의 리스트
+        :return: FileItem 형식의 dict 리스트
         """
         pass
 
@@ -1,5 +1,5 @@
 import os
-from typing import List, Optional, AsyncGenerator
+from typing import List, Optional, AsyncGenerator, Dict, Any
 from .base import FileSystemProvider, FileItem
 import asyncio
 import shutil
@@ -14,24 +14,35 @@ class LocalProvider(FileSystemProvider):
     def __init__(self, root_dir: str = None, provider_id: Optional[str] = None):
         super().__init__(provider_id)
         self.root_dir = os.path.abspath(root_dir) if root_dir else os.getcwd()
+        # 심볼릭 링크를 해석한 루트 경로 (경로 검사 및 상대 경로 계산의 기준)
+        self._root_real = os.path.realpath(self.root_dir)
+        # _root_real 하위 절대 경로에서 상대 경로를 잘라내기 위한 접두사 길이 (구분자 포함)
+        self._root_prefix_len = len(os.path.join(self._root_real, ''))
 
     def _get_full_path(self, path: str) -> str:
         """요청된 상대 경로를 안전한 절대 경로로 변환합니다."""
-        full_path = os.path.abspath(os.path.join(self.root_dir, path))
-        if not full_path.startswith(self.root_dir):
+        full_path = os.path.abspath(os.path.join(self._root_real, path))
+        # 포함 여부는 심볼릭 링크를 해석한 경로로 검사하되, 파일 작업에는 해석 전 경로를 반환합니다.
+        # (해석된 경로를 반환하면 링크 삭제 시 링크 대상이 삭제됩니다)
+        resolved_path = os.path.realpath(full_path)
+        try:
+            is_inside_root = all(
+                os.path.commonpath([self._root_real, candidate]) == self._root_real
+                for candidate in (full_path, resolved_path)
+            )
+        except ValueError: # 서로 다른 드라이브 등 비교할 수 없는 경로
+            is_inside_root = False
+        if not is_inside_root:
             raise PermissionError("Access denied: Path is outside the root directory.")
         return full_path
 
-    async def list_files(self, path: str) -> List[FileItem]:
+    async def list_files(self, path: str) -> List[Dict[str, Any]]:
         full_path = self._get_full_path(path)
         if not os.path.exists(full_path) or not os.path.isdir(full_path):
             raise FileNotFoundError(f"Directory not found: {path}")
 
-        items = []
-        for item_name in os.listdir(full_path):
-            item_path = os.path.join(full_path, item_name)
-            items.append(self._create_file_item(item_path))
-        return items
+        with os.scandir(full_path) as it:
+            return [self._entry_to_dict(entry) for entry in it]
 
     async def get_metadata(self, path: str) -> Optional[FileItem]:
         try:
@@ -49,10 +60,8 @@ class LocalProvider(FileSystemProvider):
                 return None
             
             # 비동기적으로 파일 읽기
-            loop = asyncio.get_running_loop()
-            with open(full_path, 'r', encoding='utf-8', errors='ignore') as f:
-                content = await loop.run_in_executor(None, f.read)
-            return content
+            async with aiofiles.open(full_path, 'r', encoding='utf-8', errors='ignore') as f:
+                return await f.read()
         except Exception:
             return None
 
@@ -61,14 +70,24 @@ class LocalProvider(FileSystemProvider):
         if not os.path.isdir(full_path):
             raise FileNotFoundError(f"Directory not found: {path}")
 
+        # os.walk와 stat 호출은 블로킹이므로 이벤트 루프 밖(스레드)에서 실행
+        return await asyncio.to_thread(self._walk_items, full_path)
+
+    def _walk_items(self, full_path: str) -> List[FileItem]:
+        """지정된 절대 경로 하위의 모든 파일/디렉터리를 FileItem 목록으로 반환합니다."""
         items = []
-        for root, dirs, files in os.walk(full_path):
-            for name in files:
-                item_path = os.path.join(root, name)
-                items.append(self._create_file_item(item_path))
-            for name in dirs:
-                item_path = os.path.join(root, name)
-                items.append(self._create_file_item(item_path))
+        # os.walk 대신 os.scandir와 명시적 스택으로 순회하여 항목별 경로 조합/stat 호출을 줄입니다.
+        stack = [full_path]
+        while stack:
+            try:
+                it = os.scandir(stack.pop())
+            except OSError:
+                continue # os.walk와 동일하게 읽을 수 없는 디렉터리는 건너뜁니다.
+            with it:
+                for entry in it:
+                    items.append(self._create_file_item_from_entry(entry))
+                    if entry.is_dir(follow_symlinks=False):
+                        stack.append(entry.path)
         return items
 
     async def upload_file(self, destination_path: str, file_obj: UploadFile) -> bool:
@@ -114,7 +133,24 @@ class LocalProvider(FileSystemProvider):
         return FileItem(
             name=os.path.basename(item_path),
             is_directory=is_directory,
-            path=os.path.relpath(item_path, self.root_dir).replace('\\', '/'),
+            path=os.path.relpath(item_path, self._root_real).replace('\\', '/'),
             size=os.path.getsize(item_path) if not is_directory else None,
             last_modified=os.path.getmtime(item_path)
         )
+
+    def _entry_to_dict(self, entry: os.DirEntry) -> Dict[str, Any]:
+        """Helper to build a FileItem-shaped dict from an os.scandir entry, reusing a single stat call."""
+        is_directory = entry.is_dir()
+        stat = entry.stat()
+        return {
+            "name": entry.name,
+            "is_directory": is_directory,
+            "path": entry.path[self._root_prefix_len:].replace('\\', '/'),
+            "size": stat.st_size if not is_directory else None,
+            "last_modified": stat.st_mtime,
+        }
+
+    def _create_file_item_from_entry(self, entry: os.DirEntry) -> FileItem:
+        """Helper to create a FileItem from an os.scandir entry."""
+        # 로컬 파일 시스템 값은 이미 올바른 타입이므로 검증 없이 생성합니다.
+        return FileItem.model_construct(**self._entry_to_dict(entry))
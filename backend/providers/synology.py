@@ -1,6 +1,7 @@
 import httpx
+import orjson
 import os
-from typing import List, Optional, AsyncGenerator
+from typing import List, Optional, AsyncGenerator, Dict, Any
 from .base import FileSystemProvider, FileItem
 import asyncio
 from fastapi import UploadFile
@@ -8,6 +9,11 @@ import chardet
 
 # Synology API의 응답 형식에 맞춘 Pydantic 모델 (필요에 따라 추가)
 
+# Synology API 응답을 신뢰할 수 있는 입력으로 간주할지 여부.
+# True이면 Pydantic 검증을 생략하는 FileItem.model_construct로 FileItem을 생성합니다.
+TRUSTED_INPUT = True
+_build_file_item = FileItem.model_construct if TRUSTED_INPUT else FileItem
+
 class SynologyAPIProvider(FileSystemProvider):
     """
     Synology File Station API를 위한 Provider.
@@ -23,7 +29,16 @@ class SynologyAPIProvider(FileSystemProvider):
         self.base_url = f"https://{self.host}:{self.port}/webapi" if self.secure else f"http://{self.host}:{self.port}/webapi"
         self._sid = None # 세션 ID
         self._syno_token = None # CSRF 방지를 위한 Syno Token
-        self.client = httpx.AsyncClient(verify=self.secure) # 비동기 HTTP 클라이언트
+        # 비동기 HTTP 클라이언트 (모든 Synology API 호출에서 재사용)
+        # HTTP/2 다중화와 keep-alive 커넥션 풀을 사용하며, 연결 실패 시 1회 재시도합니다.
+        # 참고: verify=self.secure는 HTTPS(secure=True)일 때만 인증서를 검증합니다. HTTP에서는 TLS가 없으므로 영향이 없습니다.
+        transport = httpx.AsyncHTTPTransport(
+            http2=True,
+            verify=self.secure,
+            limits=httpx.Limits(max_keepalive_connections=20, max_connections=50),
+            retries=1
+        )
+        self.client = httpx.AsyncClient(transport=transport, timeout=httpx.Timeout(10.0, connect=5.0))
 
     async def _login(self, otp_code: Optional[str] = None):
         """
@@ -48,7 +63,7 @@ class SynologyAPIProvider(FileSystemProvider):
             # POST 요청 시에는 파라미터를 'data'로 전달하여 form-encoded body로 보냅니다.
             response = await self.client.post(f"{self.base_url}/{api_path}", data=params)
             response.raise_for_status() # HTTP 오류 발생 시 예외 발생
-            data = response.json()
+            data = orjson.loads(response.content)
 
             if data.get("success"):
                 self._sid = data["data"]["sid"]
@@ -87,7 +102,7 @@ class SynologyAPIProvider(FileSystemProvider):
                 response = await self.client.get(f"{self.base_url}/{api_path}", params=full_params)
             
             response.raise_for_status()
-            data = response.json()
+            data = orjson.loads(response.content)
 
             if not data.get("success"):
                 error_code = data.get("error", {}).get("code")
@@ -96,52 +111,55 @@ class SynologyAPIProvider(FileSystemProvider):
         except httpx.RequestError as e:
             raise ConnectionError(f"Synology NAS API 요청 실패: {e}")
 
-    def _parse_file_data(self, file_data: dict) -> FileItem:
-        """API 응답 데이터를 FileItem 모델로 변환하는 헬퍼 함수"""
+    def _parse_file_dict(self, file_data: dict) -> Dict[str, Any]:
+        """API 응답 데이터를 FileItem 형식의 dict로 변환하는 헬퍼 함수"""
         is_dir = file_data["isdir"]
         additional = file_data.get("additional", {})
         time_info = additional.get("time", {})
         
-        return FileItem(
-            name=file_data["name"],
-            is_directory=is_dir,
-            path=file_data["path"],
-            size=additional.get("size") if not is_dir else None,
-            last_modified=time_info.get("mtime", 0)
-        )
+        return {
+            "name": file_data["name"],
+            "is_directory": is_dir,
+            "path": file_data["path"],
+            "size": additional.get("size") if not is_dir else None,
+            "last_modified": time_info.get("mtime", 0),
+        }
+
+    def _parse_file_data(self, file_data: dict) -> FileItem:
+        """API 응답 데이터를 FileItem 모델로 변환하는 헬퍼 함수"""
+        return _build_file_item(**self._parse_file_dict(file_data))
 
-    async def list_shares(self) -> List[FileItem]:
+    async def list_shares(self) -> List[Dict[str, Any]]:
         """
         Synology NAS의 모든 공유 폴더 목록을 조회합니다.
         """
         data = await self._api_request("SYNO.FileStation.List", "list_share", {})
-        items = []
-        for share_data in data["data"]["shares"]:
-            # list_share는 additional 정보가 없으므로 수동으로 생성
-            item = FileItem(
-                name=share_data["name"],
-                is_directory=True,
-                path=share_data["path"],
-                size=None,
-                last_modified=0 # 공유 폴더는 수정 시간이 없음
-            )
-            items.append(item)
-        return items
+        # list_share는 additional 정보가 없으므로 수동으로 생성
+        return [
+            {
+                "name": share_data["name"],
+                "is_directory": True,
+                "path": share_data["path"],
+                "size": None,
+                "last_modified": 0, # 공유 폴더는 수정 시간이 없음
+            }
+            for share_data in data["data"]["shares"]
+        ]
 
-    async def list_files(self, path: str) -> List[FileItem]:
-        """
-        지정된 경로의 파일 및 디렉터리 목록을 반환합니다.
-        """
+    async def _list_raw(self, path: str) -> List[dict]:
+        """지정된 경로의 파일 및 디렉터리에 대한 API 원본 데이터 목록을 반환합니다."""
         params = {
             "folder_path": path,
             "additional": '["real_path","size","owner","time"]'
         }
         data = await self._api_request("SYNO.FileStation.List", "list", params)
-        
-        items = []
-        for file_data in data["data"]["files"]:
-            items.append(self._parse_file_data(file_data))
-        return items
+        return data["data"]["files"]
+
+    async def list_files(self, path: str) -> List[Dict[str, Any]]:
+        """
+        지정된 경로의 파일 및 디렉터리 목록을 반환합니다.
+        """
+        return [self._parse_file_dict(file_data) for file_data in await self._list_raw(path)]
 
     async def get_metadata(self, path: str) -> Optional[FileItem]:
         """지정된 파일 또는 디렉터리의 메타데이터를 반환합니다."""
@@ -210,7 +228,7 @@ class SynologyAPIProvider(FileSystemProvider):
 
                 # 현재 경로가 디렉토리일 경우, 하위 목록 조회
                 if meta and meta.is_directory:
-                    items = await self.list_files(current_path)
+                    items = [self._parse_file_data(file_data) for file_data in await self._list_raw(current_path)]
                     for item in items:
                         if item.is_directory:
                             queue.append(item.path) # 하위 디렉토리는 큐에 추가
@@ -1,9 +1,79 @@
 import os
-from typing import List, Dict, Any
+import asyncio
+from collections import OrderedDict
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+from typing import List, Dict, Any, Tuple, AsyncIterable
 from chromadb import Client, Settings
-from chromadb.utils import embedding_functions
+from chromadb.api.types import EmbeddingFunction, Documents, Embeddings
 from sentence_transformers import SentenceTransformer, CrossEncoder # Added CrossEncoder
 
+# 임베딩 모델: 기본은 경량 다국어 MiniLM(약 33M 파라미터)이며,
+# USE_HIGH_QUALITY_EMBEDDING 환경 변수를 설정하면 한국어 특화 KoSimCSE(약 110M)를 사용합니다.
+# 모델을 변경한 경우 ChromaDB를 초기화하고 재인덱싱해야 합니다.
+EMBEDDING_MODEL_NAME = (
+    'BM-K/KoSimCSE-roberta'
+    if os.getenv("USE_HIGH_QUALITY_EMBEDDING", "").lower() in ("1", "true", "yes")
+    else 'paraphrase-multilingual-MiniLM-L12-v2'
+)
+
+# upsert 한 번에 저장할 최대 항목 수 (청크 및 파일 벡터)
+INDEX_BATCH_SIZE = 128
+# SentenceTransformer.encode의 내부 배치 크기
+EMBEDDING_BATCH_SIZE = 64
+# 대량 인덱싱 시 임베딩을 계산할 워커 프로세스 수
+# 워커마다 모델을 따로 로드하므로(워커당 수백 MB) GIL 및 토크나이저 경합 없이 배치를 병렬 처리하며,
+# 메인 프로세스의 모델은 검색 쿼리 전용으로 남습니다.
+EMBEDDING_WORKERS = int(os.getenv("EMBEDDING_WORKERS", "2"))
+# 쿼리 임베딩 LRU 캐시의 최대 항목 수
+QUERY_CACHE_SIZE = 512
+# 검색 한 번에 반환할 최대 파일 수 (재순위 지정 및 스니펫 조회 비용 제한)
+SEARCH_MAX_RESULTS = 20
+# 검색 시 파일당 스니펫 후보로 가져올 청크 수
+SNIPPET_CANDIDATES_PER_FILE = 5
+
+# 'file_contents' 컬렉션의 HNSW(근사 최근접 이웃) 인덱스 설정
+# - M / construction_ef: 클수록 그래프 품질(재현율)이 좋아지지만 인덱싱이 느려지고 메모리를 더 사용합니다.
+# - search_ef: 클수록 검색 재현율이 높아지지만 쿼리가 느려집니다. CHROMA_HNSW_SEARCH_EF 환경 변수로 조정하며,
+#   서버 시작 시 기존 컬렉션에도 적용됩니다.
+# space/M/construction_ef는 컬렉션 생성 시에만 적용되므로, 변경하려면 컬렉션을 초기화해야 합니다.
+HNSW_METADATA = {
+    "hnsw:space": "cosine",
+    "hnsw:M": 32,
+    "hnsw:construction_ef": 200,
+    "hnsw:search_ef": int(os.getenv("CHROMA_HNSW_SEARCH_EF", "64")),
+}
+
+# 인덱싱 워커 프로세스에 로드된 임베딩 모델
+_worker_model: SentenceTransformer = None
+
+def _init_embedding_worker(model_name: str, num_threads: int):
+    """인덱싱 워커 프로세스마다 임베딩 모델을 한 번 로드합니다."""
+    global _worker_model
+    import torch
+    # 워커들이 CPU 코어를 나눠 쓰도록 워커당 연산 스레드 수를 제한
+    torch.set_num_threads(num_threads)
+    _worker_model = SentenceTransformer(model_name)
+
+def _encode_in_worker(texts: List[str]) -> np.ndarray:
+    """워커 프로세스에서 텍스트 배치를 정규화된 임베딩으로 변환합니다."""
+    return _worker_model.encode(
+        texts,
+        batch_size=EMBEDDING_BATCH_SIZE,
+        convert_to_numpy=True,
+        normalize_embeddings=True,
+        show_progress_bar=False
+    )
+
+class _LocalSTEmbeddingFunction(EmbeddingFunction):
+    """이미 로드된 SentenceTransformer 모델을 재사용하는 ChromaDB용 임베딩 함수."""
+    def __init__(self, model: SentenceTransformer):
+        self.model = model
+
+    def __call__(self, input: Documents) -> Embeddings:
+        return self.model.encode(input, convert_to_numpy=True, normalize_embeddings=True).tolist()
+
 class SearchService:
     def __init__(self, db_path: str = "./chroma_db"):
         # ChromaDB 클라이언트 초기화
@@ -14,62 +84,219 @@ class SearchService:
         ))
         
         # SentenceTransformer 모델 로드
-        self.embedding_model = SentenceTransformer('paraphrase-multilingual-MiniLM-L12-v2')
+        self.embedding_model = SentenceTransformer(EMBEDDING_MODEL_NAME)
+        # 컬렉션에도 같은 모델 인스턴스를 전달하여 모델이 중복 로드되지 않도록 합니다.
+        self._embedding_function = _LocalSTEmbeddingFunction(self.embedding_model)
         
+        # 대량 인덱싱용 임베딩 워커 프로세스 풀 (첫 작업 제출 시 워커가 시작됨)
+        # torch가 로드된 프로세스를 fork하면 교착될 수 있으므로 spawn 방식을 사용합니다.
+        self._index_executor = ProcessPoolExecutor(
+            max_workers=EMBEDDING_WORKERS,
+            mp_context=multiprocessing.get_context("spawn"),
+            initializer=_init_embedding_worker,
+            initargs=(EMBEDDING_MODEL_NAME, max(1, (os.cpu_count() or 1) // EMBEDDING_WORKERS))
+        )
+
+        # 쿼리 문자열 -> 임베딩 벡터 LRU 캐시
+        self._query_cache: OrderedDict = OrderedDict()
+
         # Re-ranker 모델 로드 (한국어 모델)
         self.re_ranker = CrossEncoder('Dongjin-kr/ko-reranker') # Load Korean re-ranker
         
         # ChromaDB 컬렉션 생성 또는 가져오기
-        # embedding_function을 SentenceTransformer 모델로 설정합니다.
-        self.collection = self.client.get_or_create_collection(
-            name="file_contents",
-            embedding_function=embedding_functions.SentenceTransformerEmbeddingFunction(model_name='paraphrase-multilingual-MiniLM-L12-v2')
-        )
-        print(f"ChromaDB initialized at {db_path} with collection 'file_contents'")
+        # 문서/쿼리 임베딩은 _embed로 직접 계산하며, embedding_function은 이를 생략한 호출의 대비책입니다.
+        self.collection = self._get_or_create_collection("file_contents")
+        # 파일당 하나의 임베딩(청크 임베딩의 평균)을 저장하는 파일 단위 컬렉션
+        self.file_index = self._get_or_create_collection("file_index")
+        self._backfill_file_index()
+        print(f"ChromaDB initialized at {db_path} with collections 'file_contents', 'file_index'")
+        print(f"Embedding model '{EMBEDDING_MODEL_NAME}' loaded.")
         print(f"Re-ranker model 'Dongjin-kr/ko-reranker' loaded.")
 
-    async def index_chunks(self, documents: List[str], metadatas: List[Dict], ids: List[str]):
+    def _get_or_create_collection(self, name: str):
+        """HNSW 설정을 적용하여 컬렉션을 생성하거나 가져옵니다."""
+        collection = self.client.get_or_create_collection(
+            name=name,
+            embedding_function=self._embedding_function,
+            metadata=HNSW_METADATA
+        )
+
+        # 이미 존재하던 컬렉션은 생성 시 metadata가 무시되므로, 현재 search_ef 값을 별도로 반영
+        current_metadata = collection.metadata or {}
+        search_ef = HNSW_METADATA["hnsw:search_ef"]
+        if current_metadata.get("hnsw:search_ef") != search_ef:
+            try:
+                collection.modify(metadata={**current_metadata, "hnsw:search_ef": search_ef})
+                print(f"Applied hnsw:search_ef={search_ef} to collection '{name}'.")
+            except Exception as e:
+                print(f"Warning: Failed to apply hnsw:search_ef to collection '{name}': {e}")
+        return collection
+
+    def _backfill_file_index(self):
+        """
+        'file_index'가 비어 있고 청크만 저장된 경우(파일 단위 컬렉션 도입 이전의 데이터),
+        저장된 청크 임베딩을 파일별로 모아 'file_index'를 채웁니다.
+        """
+        if self.file_index.count() > 0 or self.collection.count() == 0:
+            return
+
+        file_vectors: Dict[str, np.ndarray] = {}
+        file_folders: Dict[str, str] = {}
+        offset = 0
+        while True:
+            page = self.collection.get(include=['embeddings', 'metadatas'], limit=INDEX_BATCH_SIZE, offset=offset)
+            if not page['ids']:
+                break
+            for metadata, embedding in zip(page['metadatas'], page['embeddings']):
+                if not metadata or 'file_path' not in metadata:
+                    continue
+                file_path = metadata['file_path']
+                embedding = np.asarray(embedding, dtype=np.float32)
+                if file_path in file_vectors:
+                    file_vectors[file_path] += embedding
+                else:
+                    file_vectors[file_path] = embedding.copy()
+                if metadata.get('folder'):
+                    file_folders[file_path] = metadata['folder']
+            offset += len(page['ids'])
+
+        self._upsert_file_vectors(file_vectors, file_folders)
+        print(f"Backfilled 'file_index' with {len(file_vectors)} files from stored chunks.")
+
+    def _embed(self, texts):
+        """SentenceTransformer로 텍스트(또는 텍스트 리스트)를 정규화된 임베딩으로 변환합니다."""
+        return self.embedding_model.encode(
+            texts,
+            batch_size=EMBEDDING_BATCH_SIZE,
+            convert_to_numpy=True,
+            normalize_embeddings=True,
+            show_progress_bar=False
+        )
+
+    async def _embed_query(self, query: str):
+        """쿼리 임베딩을 LRU 캐시에서 가져오고, 없으면 계산하여 캐시에 저장합니다."""
+        # 임베딩 모델은 대소문자를 구분하므로 앞뒤 공백만 정리하여 키로 사용하고, 키 자체를 임베딩합니다.
+        key = query.strip()
+        embedding = self._query_cache.get(key)
+        if embedding is not None:
+            self._query_cache.move_to_end(key)
+            return embedding
+
+        embedding = await asyncio.to_thread(self._embed, key)
+        self._query_cache[key] = embedding
+        if len(self._query_cache) > QUERY_CACHE_SIZE:
+            self._query_cache.popitem(last=False)
+        return embedding
+
+    async def index_chunks(self, documents: List[str], metadatas: List[Dict], ids: List[str], embeddings: List[List[float]] = None):
         """
         여러 텍스트 청크를 임베딩하여 ChromaDB에 일괄 저장합니다.
+        embeddings가 주어지면 임베딩 계산을 생략합니다.
         """
         if not documents:
             return
-        
-        self.collection.add(
+
+        if embeddings is None:
+            # 컬렉션의 embedding_function에 맡기지 않고, 로드된 모델로 한 번에 배치 임베딩
+            # 모델 추론은 블로킹 작업이므로 이벤트 루프 밖(스레드)에서 실행
+            embeddings = (await asyncio.to_thread(self._embed, documents)).tolist()
+
+        # 이미 존재하는 ID도 최신 내용/메타데이터('folder' 포함)로 갱신되도록 upsert 사용
+        self.collection.upsert(
             documents=documents,
             metadatas=metadatas,
-            ids=ids
+            ids=ids,
+            embeddings=embeddings
         )
         print(f"Indexed {len(documents)} chunks.")
 
+    async def index_files_bulk(self, folder_path: str, items: AsyncIterable[Tuple[str, List[str]]]) -> int:
+        """
+        여러 파일의 (파일 경로, 청크 목록) 쌍을 받는 대로 INDEX_BATCH_SIZE 단위로 묶어 저장합니다.
+        각 청크의 'folder' 메타데이터에는 인덱싱을 요청한 폴더 경로를 기록하여,
+        폴더 단위 삭제를 메타데이터 필터로 처리할 수 있게 합니다.
+        청크 임베딩의 평균을 파일 단위 컬렉션('file_index')에도 저장합니다.
+        저장된 전체 청크 수를 반환합니다.
+        """
+        documents = []
+        metadatas = []
+        ids = []
+        # 파일 경로 -> 청크 임베딩 합계 (정규화하면 평균 벡터와 방향이 같음)
+        file_vectors: Dict[str, np.ndarray] = {}
+        total_chunks = 0
+
+        async for file_path, chunks in items:
+            for i, chunk in enumerate(chunks):
+                documents.append(chunk)
+                metadatas.append({"file_path": file_path, "folder": folder_path, "chunk_number": i + 1})
+                ids.append(f"{file_path}-chunk-{i+1}")
+
+            # 워커 수만큼의 배치가 모이면 바로 저장하여 메모리 사용량을 제한
+            if len(documents) >= INDEX_BATCH_SIZE * EMBEDDING_WORKERS:
+                total_chunks += await self._flush_chunks(documents, metadatas, ids, file_vectors)
+                documents, metadatas, ids = [], [], []
+
+        total_chunks += await self._flush_chunks(documents, metadatas, ids, file_vectors)
+        self._upsert_file_vectors(file_vectors, {file_path: folder_path for file_path in file_vectors})
+        return total_chunks
+
+    async def _flush_chunks(self, documents: List[str], metadatas: List[Dict], ids: List[str], file_vectors: Dict[str, np.ndarray]) -> int:
+        """
+        버퍼의 청크를 INDEX_BATCH_SIZE 단위로 워커 프로세스에서 임베딩하여 저장하고, 파일별 임베딩 합계를 file_vectors에 누적합니다.
+        저장한 청크 수를 반환합니다.
+        """
+        # 배치별 임베딩은 워커 프로세스에서 병렬로 계산하고, 저장은 메인 프로세스에서 순서대로 수행
+        batches = [(start, start + INDEX_BATCH_SIZE) for start in range(0, len(documents), INDEX_BATCH_SIZE)]
+        loop = asyncio.get_running_loop()
+        batch_embeddings = await asyncio.gather(*(
+            loop.run_in_executor(self._index_executor, _encode_in_worker, documents[start:end])
+            for start, end in batches
+        ))
+
+        for (start, end), embeddings in zip(batches, batch_embeddings):
+            await self.index_chunks(
+                documents=documents[start:end], metadatas=metadatas[start:end], ids=ids[start:end],
+                embeddings=embeddings.tolist()
+            )
+            for metadata, embedding in zip(metadatas[start:end], embeddings):
+                file_path = metadata["file_path"]
+                if file_path in file_vectors:
+                    file_vectors[file_path] += embedding
+                else:
+                    file_vectors[file_path] = embedding.copy()
+        return len(documents)
+
+    def _upsert_file_vectors(self, file_vectors: Dict[str, np.ndarray], file_folders: Dict[str, str]):
+        """
+        파일별 청크 임베딩 합계를 정규화하여 'file_index'에 INDEX_BATCH_SIZE 단위로 저장(갱신)합니다.
+        file_folders에 폴더 경로가 있는 파일에는 'folder' 메타데이터를 함께 기록합니다.
+        """
+        file_paths = list(file_vectors)
+        for start in range(0, len(file_paths), INDEX_BATCH_SIZE):
+            batch_paths = file_paths[start:start + INDEX_BATCH_SIZE]
+            vectors = np.stack([file_vectors[file_path] for file_path in batch_paths])
+            vectors /= np.linalg.norm(vectors, axis=1, keepdims=True)
+
+            metadatas = []
+            for file_path in batch_paths:
+                metadata = {"file_path": file_path}
+                if file_folders.get(file_path):
+                    metadata["folder"] = file_folders[file_path]
+                metadatas.append(metadata)
+
+            self.file_index.upsert(ids=batch_paths, metadatas=metadatas, embeddings=vectors.tolist())
+
     async def search(self, query: str, n_results: int = 5) -> List[Dict[str, Any]]: # Keep n_results default as 5 here, it's overridden by main.py
         """
         쿼리를 기반으로 ChromaDB에서 유사한 파일을 검색하고, 재순위 지정을 통해 결과의 정확도를 높입니다.
         """
-        item_count = self.collection.count()
-        if item_count == 0:
+        if self.file_index.count() == 0:
             return []
-        
-        # 초기 검색에서 더 많은 후보군을 가져와 재순위 지정에 사용
-        # n_results의 2배 또는 20개 중 더 작은 값으로 설정 (최대 100개)
-        candidate_n_results = min(n_results * 2, 20, item_count) # Changed to retrieve more candidates for re-ranking
 
-        results = self.collection.query(
-            query_texts=[query],
-            n_results=candidate_n_results,
-            include=['documents', 'metadatas', 'distances']
-        )
-        
-        parsed_results = []
-        if results and results['metadatas'] and results['metadatas'][0]:
-            for i in range(len(results['metadatas'][0])):
-                metadata = results['metadatas'][0][i]
-                parsed_results.append({
-                    "file_path": metadata.get('file_path', 'Unknown'),
-                    "content_snippet": results['documents'][0][i],
-                    "distance": results['distances'][0][i], # Keep original distance for reference if needed
-                    "chunk_number": metadata.get('chunk_number', 0)
-                })
+        query_embedding = (await self._embed_query(query)).tolist()
+
+        # ChromaDB 조회는 블로킹 작업이므로 한 번의 스레드 호출로 묶어서 실행
+        parsed_results = await asyncio.to_thread(self._find_file_snippets, query_embedding, n_results)
         
         # 재순위 지정을 위한 입력 준비
         if not parsed_results:
@@ -78,8 +305,8 @@ class SearchService:
         # Re-ranker는 (query, document) 쌍의 리스트를 받습니다.
         reranker_input = [[query, res['content_snippet']] for res in parsed_results]
         
-        # Re-ranker 모델을 사용하여 점수 예측
-        reranker_scores = self.re_ranker.predict(reranker_input)
+        # Re-ranker 모델을 사용하여 점수 예측 (블로킹 추론이므로 스레드에서 실행)
+        reranker_scores = await asyncio.to_thread(self.re_ranker.predict, reranker_input)
 
         # 원본 결과에 재순위 점수 추가
         for i, score in enumerate(reranker_scores):
@@ -87,29 +314,75 @@ class SearchService:
 
         # 재순위 점수를 기준으로 결과 정렬 (높은 점수가 더 관련성 높음)
         parsed_results.sort(key=lambda x: x['reranker_score'], reverse=True)
+        return parsed_results
+
+    def _find_file_snippets(self, query_embedding: List[float], n_results: int) -> List[Dict[str, Any]]:
+        """
+        쿼리 임베딩과 가장 가까운 파일들을 찾고, 파일별로 가장 유사한 청크를 스니펫으로 반환합니다.
+        """
+        file_count = self.file_index.count()
+        if file_count == 0:
+            return []
 
-        # 파일 경로 기준으로 중복을 제거하여 다양한 파일의 결과를 반환 (재순위 지정 후)
-        final_results = []
+        # 1. 파일 단위 컬렉션에서 쿼리와 가장 가까운 파일을 바로 검색 (최대 SEARCH_MAX_RESULTS개)
+        file_results = self.file_index.query(
+            query_embeddings=[query_embedding],
+            n_results=min(n_results, SEARCH_MAX_RESULTS, file_count),
+            include=['distances']
+        )
+        file_paths = file_results['ids'][0] if file_results and file_results['ids'] else []
+        if not file_paths:
+            return []
+
+        # 2. 해당 파일들의 청크 중 쿼리와 가장 유사한 청크를 파일별 스니펫으로 선택
+        results = self.collection.query(
+            query_embeddings=[query_embedding],
+            n_results=min(len(file_paths) * SNIPPET_CANDIDATES_PER_FILE, self.collection.count()),
+            where={"file_path": {"$in": file_paths}},
+            include=['documents', 'metadatas', 'distances']
+        )
+        
+        parsed_results = []
         seen_files = set()
-        for result in parsed_results:
-            if len(final_results) >= n_results:
-                break
-            if result['file_path'] not in seen_files:
-                final_results.append(result)
-                seen_files.add(result['file_path'])
-                
-        return final_results
+        if results and results['metadatas'] and results['metadatas'][0]:
+            for i in range(len(results['metadatas'][0])):
+                metadata = results['metadatas'][0][i]
+                file_path = metadata.get('file_path', 'Unknown')
+                if file_path in seen_files: # 거리순으로 정렬되어 있으므로 파일별 첫 청크가 가장 유사함
+                    continue
+                seen_files.add(file_path)
+                parsed_results.append({
+                    "file_path": file_path,
+                    "content_snippet": results['documents'][0][i],
+                    "distance": results['distances'][0][i], # Keep original distance for reference if needed
+                    "chunk_number": metadata.get('chunk_number', 0)
+                })
+
+        # 다른 파일의 청크에 밀려 스니펫을 얻지 못한 파일은 파일별로 가장 유사한 청크 하나를 조회
+        for file_path in file_paths:
+            if file_path in seen_files:
+                continue
+            file_chunk = self.collection.query(
+                query_embeddings=[query_embedding],
+                n_results=1,
+                where={"file_path": file_path},
+                include=['documents', 'metadatas', 'distances']
+            )
+            if file_chunk and file_chunk['metadatas'] and file_chunk['metadatas'][0]:
+                parsed_results.append({
+                    "file_path": file_path,
+                    "content_snippet": file_chunk['documents'][0][0],
+                    "distance": file_chunk['distances'][0][0],
+                    "chunk_number": file_chunk['metadatas'][0][0].get('chunk_number', 0)
+                })
+        return parsed_results
 
     def get_indexed_files(self) -> List[str]:
         """
         현재 ChromaDB에 인덱싱된 파일 경로 목록을 반환합니다.
         """
-        all_ids = self.collection.get(include=[])['ids']
-        if not all_ids:
-            return []
+        results = self.collection.get(include=['metadatas'])
 
-        results = self.collection.get(ids=all_ids, include=['metadatas'])
-        
         unique_paths = set()
         if results['metadatas']:
             for metadata in results['metadatas']:
@@ -126,21 +399,17 @@ class SearchService:
 
     async def delete_files_in_folder(self, folder_path: str) -> int:
         """
-        ChromaDB에서 특정 폴더 경로 하위의 모든 파일 인덱스를 삭제합니다.
+        ChromaDB에서 특정 폴더를 인덱싱하며 저장된 모든 청크를 삭제합니다.
         """
-        # ChromaDB는 metadata 필드에 대한 "starts with" 필터링을 직접 지원하지 않습니다.
-        # 따라서 모든 ID를 가져와서 애플리케이션 레벨에서 필터링합니다.
-        all_ids = self.collection.get(include=[])['ids']
-        
-        ids_to_delete = [
-            doc_id for doc_id in all_ids if doc_id.startswith(folder_path)
-        ]
-        
+        # 인덱싱 시 기록한 'folder' 메타데이터로 필터링하여 전체 ID 스캔을 피합니다.
+        ids_to_delete = self.collection.get(where={"folder": {"$eq": folder_path}}, include=[])['ids']
+
         if not ids_to_delete:
             return 0
-            
+
         self.collection.delete(ids=ids_to_delete)
-        print(f"Deleted {len(ids_to_delete)} files from folder {folder_path}")
+        self.file_index.delete(where={"folder": {"$eq": folder_path}})
+        print(f"Deleted {len(ids_to_delete)} chunks from folder {folder_path}")
         return len(ids_to_delete)
 
     def reset_db(self):
@@ -148,15 +417,11 @@ class SearchService:
         ChromaDB를 완전히 초기화합니다 (모든 데이터 삭제).
         """
         self.client.delete_collection(name="file_contents")
-        self.collection = self.client.get_or_create_collection(
-            name="file_contents",
-            embedding_function=embedding_functions.SentenceTransformerEmbeddingFunction(model_name='paraphrase-multilingual-MiniLM-L12-v2')
-        )
+        self.client.delete_collection(name="file_index")
+        self.collection = self._get_or_create_collection("file_contents")
+        self.file_index = self._get_or_create_collection("file_index")
         print("ChromaDB reset.")
 
-    def __del__(self):
-        # 애플리케이션 종료 시 ChromaDB 클라이언트가 데이터를 디스크에 저장하도록 합니다.
-        # is_persistent=True 설정으로 자동 저장되므로 명시적 호출은 필요하지 않을 수 있습니다.
-        if self.client:
-            # self.client.persist() # Removed as it might not be needed with is_persistent=True
-            print("ChromaDB client initialized with persistence.")
+    def close(self):
+        """인덱싱 워커 프로세스 풀을 종료합니다."""
+        self._index_executor.shutdown(wait=False, cancel_futures=True)